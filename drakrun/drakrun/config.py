@@ -0,0 +1,58 @@
+import json
+import os
+from typing import NamedTuple, Optional, Tuple
+
+
+# (path, st_ino, st_mtime_ns, st_size) of the last parsed install.json and its contents
+_install_cache = None  # type: Optional[Tuple[Tuple[str, int, int, int], InstallInfo]]
+
+
+class InstallInfo(NamedTuple):
+    storage_backend: str
+    disk_size: str
+    iso_path: str
+    zfs_tank_name: Optional[str]
+    max_vms: int
+    # not present in install.json written by older releases
+    enable_unattended: bool = False
+    iso_sha256: Optional[str] = None
+
+    # reuses the previous result if the file didn't change
+    @staticmethod
+    def load(path: str) -> 'InstallInfo':
+        global _install_cache
+
+        st = os.stat(path)
+        key = (path, st.st_ino, st.st_mtime_ns, st.st_size)
+
+        if _install_cache is not None and _install_cache[0] == key:
+            return _install_cache[1]
+
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            st = os.fstat(fd)
+            data = os.read(fd, st.st_size)
+        finally:
+            os.close(fd)
+
+        # ignore keys we don't know about instead of failing on them
+        fields = {k: v for k, v in json.loads(data).items() if k in InstallInfo._fields}
+        install_info = InstallInfo(**fields)
+        _install_cache = ((path, st.st_ino, st.st_mtime_ns, st.st_size), install_info)
+        return install_info
+
+    # written atomically, so that concurrent load() never sees a partial file
+    def save(self, path: str):
+        global _install_cache
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(self.as_dict(), indent=4))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, path)
+        _install_cache = None
+
+    def as_dict(self) -> dict:
+        return self._asdict()
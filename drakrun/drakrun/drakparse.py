@@ -29,25 +29,26 @@ class Base:
         return f'"{self.timestamp}","{self.proc_name}","{self.pid}","{self.operation}","{self.path}","{self.result}","{self.detail}","{self.tid}"'
 
 
+# override some names that don't
+REGMON_METHODS = {
+    "NtDeleteKey": "RegDeleteKey",
+    "NtSetValueKey": "RegSetValue",
+    "NtDeleteValueKey": "RegDeleteValue",
+    "NtCreateKey": "RegCreateKey",
+    "NtCreateKeyTransacted": "RegCreateKey",
+    "NtOpenKey": "RegOpenKey",
+    "NtOpenKeyEx": "RegOpenKey",
+    "NtOpenKeyTransacted": "RegOpenKey",
+    "NtOpenKeyTransactedEx": "RegOpenKey",
+    "NtQueryKey": "RegQueryKey",
+    "NtQueryMultipleValueKey": "RegQueryValue",
+    "NtQueryValueKey": "RegQueryValue"
+}
+
+
 class Regmon(Base):
     def __init__(self, obj: Dict):
-        # override some names that don't
-        switcher = {
-            "NtDeleteKey": "RegDeleteKey",
-            "NtSetValueKey": "RegSetValue",
-            "NtDeleteValueKey": "RegDeleteValue",
-            "NtCreateKey": "RegCreateKey",
-            "NtCreateKeyTransacted": "RegCreateKey",
-            "NtOpenKey": "RegOpenKey",
-            "NtOpenKeyEx": "RegOpenKey",
-            "NtOpenKeyTransacted": "RegOpenKey",
-            "NtOpenKeyTransactedEx": "RegOpenKey",
-            "NtQueryKey": "RegQueryKey",
-            "NtQueryMultipleValueKey": "RegQueryValue",
-            "NtQueryValueKey": "RegQueryValue"
-        }
-
-        method = switcher.get(obj["Method"], "Unknown")
+        method = REGMON_METHODS.get(obj["Method"], "Unknown")
 
         if "ValueName" in obj:
             key = f"{obj['Key']}\\{obj['ValueName']}"
@@ -127,6 +128,15 @@ class Filedelete(Base):
             self.valid = False
 
 
+PLUGINS = {
+    "regmon": Regmon,
+    "filetracer": FileTracer,
+    "syscall": Syscall,
+    "filedelete": Filedelete,
+    "procmon": Procmon
+}
+
+
 """
 --- todo:
 "WriteFile"); Or lst_ProcmonRow()\\Operation = "ReadFile")
@@ -136,14 +146,6 @@ class Filedelete(Base):
 
 
 def parse_logs(lines: Iterable[str]) -> Generator[str, None, None]:
-    switcher = {
-        "regmon": Regmon,
-        "filetracer": FileTracer,
-        "syscall": Syscall,
-        "filedelete": Filedelete,
-        "procmon": Procmon
-    }
-
     # switch => get class => instantiate => str
     try:
         first_line = json.loads(next(lines))
@@ -165,8 +167,8 @@ def parse_logs(lines: Iterable[str]) -> Generator[str, None, None]:
             print('BUG: Unparseable log entry!', line)
             continue
 
-        if line_obj["Plugin"] in switcher:
-            plugin_obj = switcher[line_obj["Plugin"]]
+        if line_obj["Plugin"] in PLUGINS:
+            plugin_obj = PLUGINS[line_obj["Plugin"]]
             converted = str(plugin_obj(line_obj))
             if converted:
                 yield converted
@@ -14,6 +14,7 @@ import time
 from shutil import copyfile
 
 import requests
+from drakrun.config import InstallInfo
 from drakrun.drakpdb import fetch_pdb, make_pdb_profile, dll_file_list, pdb_guid
 from requests import RequestException
 
@@ -82,6 +83,26 @@ def detect_defaults():
             conf.write(f)
 
 
+# large chunks keep the time in OpenSSL rather than in per-call overhead
+def file_sha256(path, chunk_size=1024 * 1024):
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(hashlib, "file_digest"):
+            # Python 3.11+
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+        sha256_hash = hashlib.sha256()
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+
+        while True:
+            size = f.readinto(buf)
+            if not size:
+                break
+            sha256_hash.update(view[:size])
+
+        return sha256_hash.hexdigest()
+
+
 def install(storage_backend, disk_size, iso_path, zfs_tank_name, max_vms, unattended_xml):
     logging.info("Ensuring that drakrun@* services are stopped...")
     subprocess.check_output('systemctl stop \'drakrun@*\'', shell=True, stderr=subprocess.STDOUT)
@@ -102,23 +123,16 @@ def install(storage_backend, disk_size, iso_path, zfs_tank_name, max_vms, unatte
             except subprocess.CalledProcessError:
                 logging.exception("Failed to generate unattended.iso.")
 
-    sha256_hash = hashlib.sha256()
+    iso_sha256 = file_sha256(iso_path)
 
-    with open(iso_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-
-        iso_sha256 = sha256_hash.hexdigest()
-
-    with open(os.path.join(ETC_DIR, "install.json"), "w") as f:
-        install_info = {"storage_backend": storage_backend,
-                        "disk_size": disk_size,
-                        "iso_path": os.path.abspath(iso_path),
-                        "zfs_tank_name": zfs_tank_name,
-                        "max_vms": max_vms,
-                        "enable_unattended": unattended_xml is not None,
-                        "iso_sha256": iso_sha256}
-        f.write(json.dumps(install_info, indent=4))
+    install_info = InstallInfo(storage_backend=storage_backend,
+                               disk_size=disk_size,
+                               iso_path=os.path.abspath(iso_path),
+                               zfs_tank_name=zfs_tank_name,
+                               max_vms=max_vms,
+                               enable_unattended=unattended_xml is not None,
+                               iso_sha256=iso_sha256)
+    install_info.save(os.path.join(ETC_DIR, "install.json"))
 
     logging.info("Checking xen-detect...")
     proc = subprocess.run('xen-detect -N', shell=True)
@@ -147,47 +161,47 @@ def install(storage_backend, disk_size, iso_path, zfs_tank_name, max_vms, unatte
 
     if storage_backend == "qcow2":
         try:
-            subprocess.check_output("qemu-img --version", shell=True)
-        except subprocess.CalledProcessError:
+            subprocess.check_output(["qemu-img", "--version"])
+        except (subprocess.CalledProcessError, FileNotFoundError):
             logging.exception("Failed to determine qemu-img version. Make sure you have qemu-utils installed.")
             return
 
         try:
-            subprocess.check_output(' '.join([
+            subprocess.check_output([
                 "qemu-img",
                 "create",
                 "-f",
                 "qcow2",
                 os.path.join(LIB_DIR, "volumes/vm-0.img"),
-                shlex.quote(disk_size)
-            ]), shell=True)
+                disk_size
+            ])
         except subprocess.CalledProcessError:
             logging.exception("Failed to create a new volume using qemu-img.")
             return
     elif storage_backend == "zfs":
         try:
-            subprocess.check_output("zfs -?", shell=True)
-        except subprocess.CalledProcessError:
+            subprocess.check_output(["zfs", "-?"])
+        except (subprocess.CalledProcessError, FileNotFoundError):
             logging.exception("Failed to execute zfs command. Make sure you have ZFS support installed.")
             return
 
-        vm0_vol = shlex.quote(os.path.join(zfs_tank_name, 'vm-0'))
+        vm0_vol = os.path.join(zfs_tank_name, 'vm-0')
 
         try:
-            subprocess.check_output(f"zfs destroy -Rfr {vm0_vol}", stderr=subprocess.STDOUT, shell=True)
+            subprocess.check_output(["zfs", "destroy", "-Rfr", vm0_vol], stderr=subprocess.STDOUT)
         except subprocess.CalledProcessError as e:
             if b'dataset does not exist' not in e.output:
                 logging.exception(f"Failed to destroy the existing ZFS volume {vm0_vol}.")
                 return
 
         try:
-            subprocess.check_output(' '.join([
+            subprocess.check_output([
                 "zfs",
                 "create",
                 "-V",
-                shlex.quote(disk_size),
-                shlex.quote(os.path.join(zfs_tank_name, 'vm-0'))
-            ]), shell=True)
+                disk_size,
+                vm0_vol
+            ])
         except subprocess.CalledProcessError:
             logging.exception("Failed to create a new volume using zfs create.")
             return
@@ -252,17 +266,17 @@ def create_rekall_profiles(install_info):
     with tempfile.TemporaryDirectory() as mount_path:
         # we mount 2nd partition, as 1st partition is windows boot related and 2nd partition is C:\\
 
-        if install_info["storage_backend"] == "zfs":
+        if install_info.storage_backend == "zfs":
             # workaround for not being able to mount a snapshot
-            base_snap = shlex.quote(os.path.join(install_info["zfs_tank_name"], 'vm-0@booted'))
-            tmp_snap = shlex.quote(os.path.join(install_info["zfs_tank_name"], 'tmp'))
+            base_snap = os.path.join(install_info.zfs_tank_name, 'vm-0@booted')
+            tmp_snap = os.path.join(install_info.zfs_tank_name, 'tmp')
             try:
-                subprocess.check_output(f'zfs clone {base_snap} {tmp_snap}', shell=True)
+                subprocess.check_output(['zfs', 'clone', base_snap, tmp_snap])
             except subprocess.CalledProcessError:
                 logging.warning("Failed to clone temporary zfs snapshot. Aborting generation of usermode rekall profiles")
                 return
 
-            volume_path = os.path.join("/", "dev", "zvol", install_info["zfs_tank_name"], "tmp-part2")
+            volume_path = os.path.join("/", "dev", "zvol", install_info.zfs_tank_name, "tmp-part2")
             # Wait for 60s for the volume to appear in /dev/zvol/...
             for _ in range(60):
                 if os.path.exists(volume_path):
@@ -274,12 +288,11 @@ def create_rekall_profiles(install_info):
             try:
                 # We have to wait for a moment for zvol to appear
                 time.sleep(1.0)
-                tmp_mount = shlex.quote(volume_path)
-                subprocess.check_output(f'mount -t ntfs -o ro {tmp_mount} {mount_path}', shell=True)
+                subprocess.check_output(['mount', '-t', 'ntfs', '-o', 'ro', volume_path, mount_path])
             except subprocess.CalledProcessError:
                 logging.warning("Failed to mount temporary zfs snapshot. Aborting generation of usermode rekall profiles")
                 try:
-                    subprocess.check_output(f'zfs destroy {tmp_snap}', shell=True)
+                    subprocess.check_output(['zfs', 'destroy', tmp_snap])
                 except subprocess.CalledProcessError:
                     logging.exception('Failed to cleanup after zfs tmp snapshot')
                 return
@@ -292,17 +305,17 @@ def create_rekall_profiles(install_info):
 
             # TODO: this assumes /dev/nbd0 is free
             try:
-                subprocess.check_output(f"qemu-nbd -c /dev/nbd0 --read-only {os.path.join(LIB_DIR, 'volumes', 'vm-0.img')}", shell=True)
+                subprocess.check_output(['qemu-nbd', '-c', '/dev/nbd0', '--read-only', os.path.join(LIB_DIR, 'volumes', 'vm-0.img')])
             except subprocess.CalledProcessError:
                 logging.warning("Failed to load quemu image as nbd0. Aborting generation of usermode rekall profiles")
                 return
 
             try:
-                subprocess.check_output(f"mount -t ntfs -o ro /dev/nbd0p2 {mount_path}", shell=True)
+                subprocess.check_output(['mount', '-t', 'ntfs', '-o', 'ro', '/dev/nbd0p2', mount_path])
             except subprocess.CalledProcessError:
                 logging.warning("Failed to mount nbd0p2. Aborting generation of usermode rekall profiles")
                 try:
-                    subprocess.check_output('qemu-nbd --disconnect /dev/nbd0', shell=True)
+                    subprocess.check_output(['qemu-nbd', '--disconnect', '/dev/nbd0'])
                 except subprocess.CalledProcessError:
                     logging.exception('Failed to cleanup after nbd0')
                 return
@@ -333,22 +346,20 @@ def create_rekall_profiles(install_info):
                     os.remove(os.path.join(profiles_path, tmp))
 
         # cleanup
-        subprocess.check_output(f'umount {mount_path}', shell=True)
+        subprocess.check_output(['umount', mount_path])
 
-    if install_info["storage_backend"] == "zfs":
-        subprocess.check_output(f'zfs destroy {tmp_snap}', shell=True)
+    if install_info.storage_backend == "zfs":
+        subprocess.check_output(['zfs', 'destroy', tmp_snap])
     else:  # qcow2
-        subprocess.check_output('qemu-nbd --disconnect /dev/nbd0', shell=True)
+        subprocess.check_output(['qemu-nbd', '--disconnect', '/dev/nbd0'])
 
 
 def generate_profiles(no_report=False, generate_usermode=True):
     if os.path.exists(os.path.join(ETC_DIR, "no_usage_reports")):
         no_report = True
 
-    with open(os.path.join(ETC_DIR, "install.json"), 'r') as f:
-        install_info = json.loads(f.read())
-
-    max_vms = install_info["max_vms"]
+    install_info = InstallInfo.load(os.path.join(ETC_DIR, "install.json"))
+    max_vms = install_info.max_vms
     output = subprocess.check_output(['vmi-win-guid', 'name', 'vm-0'], timeout=30).decode('utf-8')
 
     try:
@@ -403,16 +414,19 @@ def generate_profiles(no_report=False, generate_usermode=True):
 
     logging.info("Snapshot was saved succesfully.")
 
-    if install_info["storage_backend"] == 'zfs':
-        snap_name = shlex.quote(os.path.join(install_info["zfs_tank_name"], 'vm-0@booted'))
-        subprocess.check_output(f'zfs snapshot {snap_name}', shell=True)
+    if install_info.storage_backend == 'zfs':
+        snap_name = os.path.join(install_info.zfs_tank_name, 'vm-0@booted')
+        subprocess.check_output(['zfs', 'snapshot', snap_name])
 
     if generate_usermode:
         create_rekall_profiles(install_info)
 
+    with open(os.path.join(ETC_DIR, 'scripts/cfg.template'), 'r') as f:
+        cfg_template = f.read()
+
     for vm_id in range(max_vms + 1):
         # we treat vm_id=0 as special internal one
-        generate_vm_conf(install_info, vm_id)
+        generate_vm_conf(install_info, vm_id, cfg_template)
 
     if not no_report:
         send_usage_report({
@@ -422,7 +436,7 @@ def generate_profiles(no_report=False, generate_usermode=True):
                 "version": version
             },
             "install_iso": {
-                "sha256": install_info["iso_sha256"]
+                "sha256": install_info.iso_sha256
             }
         })
 
@@ -435,27 +449,31 @@ def reenable_services():
         logging.info("Not re-enabling services, install.json is missing.")
         return
 
-    with open(os.path.join(ETC_DIR, "install.json"), 'r') as f:
-        install_info = json.loads(f.read())
-
-    max_vms = install_info["max_vms"]
+    install_info = InstallInfo.load(os.path.join(ETC_DIR, "install.json"))
+    max_vms = install_info.max_vms
 
     subprocess.check_output('systemctl disable \'drakrun@*\'', shell=True, stderr=subprocess.STDOUT)
     subprocess.check_output('systemctl stop \'drakrun@*\'', shell=True, stderr=subprocess.STDOUT)
 
-    for vm_id in range(1, max_vms + 1):
-        logging.info("Enabling and starting drakrun@{}...".format(vm_id))
-        subprocess.check_output('systemctl enable drakrun@{}'.format(vm_id), shell=True, stderr=subprocess.STDOUT)
-        subprocess.check_output('systemctl restart drakrun@{}'.format(vm_id), shell=True, stderr=subprocess.STDOUT)
+    services = ['drakrun@{}'.format(vm_id) for vm_id in range(1, max_vms + 1)]
 
+    if not services:
+        return
 
-def generate_vm_conf(install_info, vm_id):
-    iso_path = install_info['iso_path']
-    storage_backend = install_info['storage_backend']
-    zfs_tank_name = install_info['zfs_tank_name']
+    # systemctl queues all units before waiting, so systemd starts them in parallel
+    logging.info("Enabling and starting {}...".format(', '.join(services)))
+    subprocess.check_output(['systemctl', 'enable'] + services, stderr=subprocess.STDOUT)
+    subprocess.check_output(['systemctl', 'restart'] + services, stderr=subprocess.STDOUT)
 
-    with open(os.path.join(ETC_DIR, 'scripts/cfg.template'), 'r') as f:
-        template = f.read()
+
+def generate_vm_conf(install_info, vm_id, template=None):
+    iso_path = install_info.iso_path
+    storage_backend = install_info.storage_backend
+    zfs_tank_name = install_info.zfs_tank_name
+
+    if template is None:
+        with open(os.path.join(ETC_DIR, 'scripts/cfg.template'), 'r') as f:
+            template = f.read()
 
     disks = []
 
@@ -468,7 +486,7 @@ def generate_vm_conf(install_info, vm_id):
 
     disks.append('file:{iso},hdc:cdrom,r'.format(iso=os.path.abspath(iso_path)))
 
-    if install_info['enable_unattended']:
+    if install_info.enable_unattended:
         disks.append('file:{main_dir}/volumes/unattended.iso,hdd:cdrom,r'.format(main_dir=LIB_DIR))
 
     disks = ', '.join(['"{}"'.format(disk) for disk in disks])
@@ -4,12 +4,14 @@ import logging
 import os
 import shutil
 import argparse
+import functools
 import subprocess
 import hashlib
 import socket
 import time
 import zipfile
-from typing import Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Tuple
 
 import pefile
 import json
@@ -19,6 +21,7 @@ import magic
 from karton2 import Karton, Config, Task, LocalResource
 from stat import S_ISREG, ST_CTIME, ST_MODE, ST_SIZE
 import drakrun.run as d_run
+from drakrun.config import InstallInfo
 from drakrun.drakpdb import dll_file_list
 from drakrun.drakparse import parse_logs
 
@@ -34,12 +37,23 @@ def get_domid_from_instance_id(instance_id: str) -> int:
     return int(output.decode('utf-8').strip())
 
 
-def start_tcpdump_collector(instance_id: str, outdir: str) -> Optional[subprocess.Popen]:
-    domid = get_domid_from_instance_id(instance_id)
+@functools.lru_cache(maxsize=None)
+def tool_works(probe_cmd: Tuple[str, ...]) -> bool:
+    # probe once per process, the result doesn't change between analyses
+    if shutil.which(probe_cmd[0]) is None:
+        return False
 
     try:
-        subprocess.check_output("tcpdump --version", shell=True)
+        subprocess.check_output(probe_cmd)
     except subprocess.CalledProcessError:
+        return False
+    return True
+
+
+def start_tcpdump_collector(instance_id: str, outdir: str) -> Optional[subprocess.Popen]:
+    domid = get_domid_from_instance_id(instance_id)
+
+    if not tool_works(("tcpdump", "--version")):
         logging.warning("Seems like tcpdump is not working/not installed on your system. Pcap will not be recorded.")
         return
 
@@ -53,9 +67,7 @@ def start_tcpdump_collector(instance_id: str, outdir: str) -> Optional[subproces
 
 
 def start_dnsmasq(vm_id: int, dns_server: str) -> Optional[subprocess.Popen]:
-    try:
-        subprocess.check_output("dnsmasq --version", shell=True)
-    except subprocess.CalledProcessError:
+    if not tool_works(("dnsmasq", "--version")):
         logging.warning("Seems like dnsmasq is not working/not installed on your system."
                         "Guest networking may not be fully functional.")
         return
@@ -109,6 +121,21 @@ class DrakrunKarton(Karton):
         if not self.minio.bucket_exists('drakrun'):
             self.minio.make_bucket(bucket_name='drakrun')
 
+        # warm up the per-process caches used by process() while the network is being set up
+        with ThreadPoolExecutor(max_workers=3) as prefetch:
+            futures = [
+                prefetch.submit(InstallInfo.load, os.path.join(ETC_DIR, "install.json")),
+                prefetch.submit(tool_works, ("tcpdump", "--version")),
+                prefetch.submit(tool_works, ("dnsmasq", "--version")),
+            ]
+
+            self._init_network()
+
+        for future in futures:
+            if future.exception() is not None:
+                self.log.error("Prefetch failed during initialization", exc_info=future.exception())
+
+    def _init_network(self):
         try:
             subprocess.check_output(f'brctl addbr drak{INSTANCE_ID}', stderr=subprocess.STDOUT, shell=True)
         except subprocess.CalledProcessError as e:
@@ -349,6 +376,7 @@ class DrakrunKarton(Karton):
 
         watcher_tcpdump = None
         watcher_dnsmasq = None
+        install_info = InstallInfo.load(os.path.join(ETC_DIR, "install.json"))
 
         for _ in range(3):
             try:
@@ -358,7 +386,7 @@ class DrakrunKarton(Karton):
                 d_run.ETC_DIR = ETC_DIR
                 d_run.LIB_DIR = LIB_DIR
                 d_run.logging = self.log
-                d_run.run_vm(INSTANCE_ID)
+                d_run.run_vm(INSTANCE_ID, install_info)
 
                 watcher_tcpdump = start_tcpdump_collector(INSTANCE_ID, outdir)
 
@@ -418,10 +446,9 @@ class DrakrunKarton(Karton):
             except subprocess.CalledProcessError:
                 self.log.info("Something went wrong with the VM {}".format(INSTANCE_ID), exc_info=True)
             finally:
-                try:
-                    subprocess.run(["xl", "destroy", "vm-{}".format(INSTANCE_ID)], cwd=workdir, check=True)
-                except subprocess.CalledProcessError:
-                    self.log.info("Failed to destroy VM {}".format(INSTANCE_ID), exc_info=True)
+                destroy_error = d_run.destroy_vm(INSTANCE_ID)
+                if destroy_error is not None:
+                    self.log.info("Failed to destroy VM {}: {}".format(INSTANCE_ID, destroy_error))
 
                 if watcher_dnsmasq:
                     watcher_dnsmasq.terminate()
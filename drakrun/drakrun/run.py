@@ -4,50 +4,107 @@ import logging
 import os
 import subprocess
 import time
-import json
+from typing import Optional
 
+from drakrun.config import InstallInfo
 from drakrun.genmac import gen_mac, print_mac
 
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
 LIB_DIR = os.path.dirname(os.path.realpath(__file__))
 ETC_DIR = os.path.dirname(os.path.realpath(__file__))
 
 
-def run_vm(vm_id):
-    with open(os.path.join(ETC_DIR, "install.json"), "rb") as f:
-        install_info = json.loads(f.read())
+# returns None if inotify can't be used for watching path
+def watch_dir(path) -> Optional['INotify']:
+    if INotify is None:
+        return None
 
     try:
-        subprocess.check_output(["xl", "destroy", "vm-{vm_id}".format(vm_id=vm_id)], stderr=subprocess.STDOUT)
-    except subprocess.CalledProcessError:
-        pass
+        inotify = INotify()
+    except OSError:
+        return None
 
     try:
-        os.unlink(os.path.join(LIB_DIR, "volumes/vm-{vm_id}.img".format(vm_id=vm_id)))
-    except FileNotFoundError:
-        pass
+        # udev creates links under a temporary name and renames them into place
+        inotify.add_watch(path, flags.CREATE | flags.MOVED_TO)
+    except OSError:
+        inotify.close()
+        return None
+
+    return inotify
+
+
+def wait_for_path(path, timeout, inotify=None) -> bool:
+    deadline = time.monotonic() + timeout
+
+    while not os.path.exists(path):
+        remaining = deadline - time.monotonic()
+
+        if remaining <= 0:
+            return False
+
+        # cap each wait, so that a missed event costs no more than a poll interval
+        if inotify is not None:
+            inotify.read(timeout=int(min(0.1, remaining) * 1000))
+        else:
+            time.sleep(min(0.1, remaining))
+
+    return True
+
 
-    if install_info['storage_backend'] == 'qcow2':
+# returns xl's output if the destroy failed, None otherwise
+def destroy_vm(vm_id) -> Optional[str]:
+    proc = subprocess.run(["xl", "destroy", f"vm-{vm_id}"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    if proc.returncode != 0:
+        return proc.stdout.decode('utf-8', 'replace').strip()
+
+    return None
+
+
+def run_vm(vm_id, install_info=None):
+    if install_info is None:
+        install_info = InstallInfo.load(os.path.join(ETC_DIR, "install.json"))
+
+    vm_name = f"vm-{vm_id}"
+    vm_cfg = os.path.join(ETC_DIR, f"configs/{vm_name}.cfg")
+    vm_img = os.path.join(LIB_DIR, f"volumes/{vm_name}.img")
+    snapshot_sav = os.path.join(LIB_DIR, "volumes/snapshot.sav")
+
+    destroy_error = destroy_vm(vm_id)
+    if destroy_error is not None:
+        logging.info(f"Failed to destroy VM {vm_id} before restore: {destroy_error}")
+
+    if install_info.storage_backend == 'qcow2':
+        # qemu-img truncates an existing overlay, so there is no need to unlink it first
         subprocess.run(["qemu-img", "create",
                         "-f", "qcow2",
-                        "-o", "backing_file=vm-0.img",
-                        os.path.join(LIB_DIR, "volumes/vm-{vm_id}.img".format(vm_id=vm_id))], check=True)
-    elif install_info['storage_backend'] == 'zfs':
-        vm_zvol = os.path.join('/dev/zvol', install_info['zfs_tank_name'], f'vm-{vm_id}')
-        vm_snap = os.path.join(install_info['zfs_tank_name'], f'vm-{vm_id}@booted')
+                        "-b", "vm-0.img",
+                        "-F", "qcow2",
+                        vm_img], check=True)
+    elif install_info.storage_backend == 'zfs':
+        tank = install_info.zfs_tank_name
+        vm_vol = f'{tank}/{vm_name}'
+        vm_zvol = f'/dev/zvol/{vm_vol}'
+        vm_snap = f'{vm_vol}@booted'
 
         if not os.path.exists(vm_zvol):
-            subprocess.run(["zfs", "clone",
-                            "-p", os.path.join(install_info['zfs_tank_name'], 'vm-0@booted'),
-                            os.path.join(install_info['zfs_tank_name'], f'vm-{vm_id}')], check=True)
-
-            for _ in range(120):
-                if not os.path.exists(vm_zvol):
-                    time.sleep(0.1)
-                else:
-                    break
-            else:
-                logging.error(f'Failed to see {vm_zvol} created after executing zfs clone command.')
-                return
+            # start watching before the clone so that udev can't beat us to it
+            inotify = watch_dir(os.path.dirname(vm_zvol))
+
+            try:
+                subprocess.run(["zfs", "clone", "-p", f'{tank}/vm-0@booted', vm_vol], check=True)
+
+                if not wait_for_path(vm_zvol, 12.0, inotify):
+                    logging.error(f'Failed to see {vm_zvol} created after executing zfs clone command.')
+                    return
+            finally:
+                if inotify is not None:
+                    inotify.close()
 
             subprocess.run(["zfs", "snapshot", vm_snap], check=True)
 
@@ -56,15 +113,15 @@ def run_vm(vm_id):
         raise RuntimeError("Unknown storage backend")
 
     try:
-        subprocess.run(["xl", "-vvv", "restore",
-                        os.path.join(ETC_DIR, "configs/vm-{vm_id}.cfg".format(vm_id=vm_id)),
-                        os.path.join(LIB_DIR, "volumes/snapshot.sav")], check=True)
+        subprocess.run(["xl", "-vvv", "restore", vm_cfg, snapshot_sav], check=True)
     except subprocess.CalledProcessError:
-        logging.exception("Failed to restore VM {vm_id}".format(vm_id=vm_id))
+        logging.exception(f"Failed to restore VM {vm_id}")
 
-        with open("/var/log/xen/qemu-dm-vm-{vm_id}.log".format(vm_id=vm_id), "rb") as f:
+        with open(f"/var/log/xen/qemu-dm-{vm_name}.log", "rb") as f:
+            # the log may be huge, only its tail is relevant
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 64 * 1024))  # 64 KiB
             logging.error(f.read())
 
-    subprocess.run(["xl", "qemu-monitor-command",
-                    "vm-{vm_id}".format(vm_id=vm_id),
-                    "change ide-5632 /tmp/drakrun/vm-{vm_id}/malwar.iso".format(vm_id=vm_id)], check=True)
+    subprocess.run(["xl", "qemu-monitor-command", vm_name,
+                    f"change ide-5632 /tmp/drakrun/{vm_name}/malwar.iso"], check=True)